@@ -1,7 +1,6 @@
 import os
 import json
-from google import genai
-from google.genai import types
+import threading
 from dotenv import load_dotenv
 import base64
 
@@ -9,19 +8,48 @@ load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-# Initialize client if key is present
-client = None
-if GEMINI_API_KEY:
-    try:
-        client = genai.Client(api_key=GEMINI_API_KEY)
-    except Exception as e:
-        print(f"Error initializing Gemini client: {e}")
+# The google-genai SDK is slow to import, so the client is built on first use
+# rather than at module load (keeps API and test process startup fast).
+_client = None
+_client_initialized = False
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Returns the shared GenAI client, or None if no API key is configured.
+    """
+    global _client, _client_initialized
+    if _client_initialized:
+        return _client
+    with _client_lock:
+        if not _client_initialized:
+            if GEMINI_API_KEY:
+                try:
+                    from google import genai
+                    _client = genai.Client(api_key=GEMINI_API_KEY)
+                except Exception as e:
+                    print(f"Error initializing Gemini client: {e}")
+            _client_initialized = True
+    return _client
+
+def _unique_item_names(items_list: list):
+    """
+    One name per canonical food, so "Greek yogurt" and "Yogurt, Greek" don't
+    both end up in a prompt. Falls back to the lowercased name for items that
+    have no canonical id yet.
+    """
+    names = {}
+    for item in items_list:
+        key = getattr(item, "canonical_id", None) or item.name.strip().lower()
+        names.setdefault(key, item.name)
+    return list(names.values())
 
 def get_nutrition_info(item_name: str, quantity: float, unit: str = None, notes: str = None):
     """
     Fetches nutritional information for a given item using Gemini (google-genai SDK).
     Returns a dictionary with calories, protein, carbs, fat.
     """
+    client = get_client()
     if not client:
         print("GenAI Client not initialized (missing API Key). Returning mock data.")
         return {
@@ -73,6 +101,7 @@ def analyze_fridge_health(items_list: list):
     """
     Analyzes the healthiness of a list of items.
     """
+    client = get_client()
     if not client:
         return {"score": 0, "analysis": "AI Service unavailable."}
 
@@ -113,6 +142,7 @@ def analyze_nutrition_label(image_bytes: bytes):
     """
     Analyzes an image of a nutrition label to extract data.
     """
+    client = get_client()
     if not client:
         return None
         
@@ -132,6 +162,7 @@ def analyze_nutrition_label(image_bytes: bytes):
         # Checking typical usage: contents=[prompt, image]
         # Image can be passed as types.Part.from_bytes(data, mime_type)
         
+        from google.genai import types
         image_part = types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg") 
         # Assuming jpeg/png, the API is flexible usually, or we can detect.
         
@@ -156,11 +187,12 @@ def generate_recipes(items_list: list):
     """
     Generates recipe suggestions based on inventory.
     """
+    client = get_client()
     if not client:
         return []
         
     try:
-        inventory_text = "\n".join([f"- {item.name}" for item in items_list])
+        inventory_text = "\n".join([f"- {name}" for name in _unique_item_names(items_list)])
         
         prompt = f"""
         You are a chef. Propose 5 recipes that can be made primarily with these ingredients:
@@ -209,11 +241,12 @@ def generate_goal_advice(items_list: list, goal: str):
     """
     Generates dietary advice based on inventory and user goal.
     """
+    client = get_client()
     if not client:
         return None
         
     try:
-        inventory_text = "\n".join([f"- {item.name}" for item in items_list])
+        inventory_text = "\n".join([f"- {name}" for name in _unique_item_names(items_list)])
         
         prompt = f"""
         You are an expert Dietitian and Health Coach. 
@@ -0,0 +1,52 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+# Tracks API cold-start cost: how long `import main` takes and how long a fresh
+# uvicorn process needs before it answers its first request.
+RUNS = 5
+
+def measure_import():
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def measure_first_request(timeout: float = 30.0):
+    port = free_port()
+    start_time = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start_time < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as res:
+                    if res.status == 200:
+                        return time.perf_counter() - start_time
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("API did not answer in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    imports = [measure_import() for _ in range(RUNS)]
+    print(f"import main:           median {statistics.median(imports) * 1000:.0f} ms "
+          f"(min {min(imports) * 1000:.0f}, max {max(imports) * 1000:.0f})")
+
+    firsts = [measure_first_request() for _ in range(RUNS)]
+    print(f"time to first request: median {statistics.median(firsts) * 1000:.0f} ms "
+          f"(min {min(firsts) * 1000:.0f}, max {max(firsts) * 1000:.0f})")
@@ -0,0 +1,255 @@
+"""
+Maps free-text item names onto canonical food ids so that "Greek yogurt",
+"greek yoghurt 2%" and "Yogurt, Greek" share one id (and one nutrition cache
+entry, one line in the AI prompts, ...).
+
+Names are first normalized (tokenize, synonyms, plurals, drop sizes/brands);
+anything that still doesn't match exactly is looked up in a character-trigram
+TF-IDF index (plus a head-word feature) over all known canonical names.
+"""
+import re
+import math
+import threading
+from collections import Counter
+from sqlalchemy.exc import IntegrityError
+
+import models
+from database import SessionLocal
+
+# Cosine similarity needed to reuse an existing canonical food for an unseen name
+SIMILARITY_THRESHOLD = 0.8
+NGRAM_SIZE = 3
+HEAD_WEIGHT = 2
+
+SYNONYMS = {
+    "yoghurt": "yogurt",
+    "aubergine": "eggplant",
+    "courgette": "zucchini",
+    "capsicum": "pepper",
+    "coriander": "cilantro",
+    "catsup": "ketchup",
+    "garbanzo": "chickpea",
+    "rocket": "arugula",
+    "prawn": "shrimp",
+}
+
+STOPWORDS = {
+    "a", "an", "and", "the", "of", "with", "fresh", "organic", "brand",
+    "pack", "package", "bag", "box", "bottle", "can", "canned", "jar", "carton",
+    "oz", "lb", "lbs", "g", "kg", "ml", "l", "gallon", "gallons", "pct", "percent",
+}
+
+# Measures and preparation words in recipe ingredient lines that aren't the food itself
+RECIPE_WORDS = {
+    "cup", "tbsp", "tsp", "tablespoon", "teaspoon", "clove", "pinch", "dash", "slice",
+    "piece", "handful", "sprig", "stick", "large", "small", "medium", "cooked", "uncooked",
+    "chopped", "diced", "minced", "sliced", "grated", "shredded", "melted", "softened",
+    "beaten", "peeled", "crushed", "halved", "drained", "rinsed", "finely", "roughly",
+    "thinly", "leftover", "optional", "taste", "to", "for", "serving",
+}
+
+# Endings that look plural but aren't ("hummus", "glass", "asparagus")
+_SINGULAR_ENDINGS = ("ss", "us", "is")
+
+def _singularize(token: str):
+    if len(token) <= 3 or token.endswith(_SINGULAR_ENDINGS):
+        return token
+    if token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith("oes") or token.endswith(("ches", "shes", "xes")):
+        return token[:-2]
+    if token.endswith("s"):
+        return token[:-1]
+    return token
+
+def tokenize(name: str):
+    tokens = []
+    for token in re.findall(r"[a-z0-9%]+", name.lower()):
+        # Sizes and fat percentages ("2%", "500ml", "12") don't change what the food is
+        if any(ch.isdigit() for ch in token) or "%" in token:
+            continue
+        token = _singularize(SYNONYMS.get(token, token))
+        token = SYNONYMS.get(token, token)
+        if token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+def canonical_key(name: str):
+    """
+    Normalized name that keeps word order ("chocolate milk" != "milk chocolate"),
+    except that catalogue-style "Yogurt, Greek" is read as "Greek Yogurt".
+    """
+    parts = [part for part in name.split(",") if part.strip()]
+    if len(parts) > 1:
+        name = " ".join(reversed(parts))
+    tokens = list(dict.fromkeys(tokenize(name)))
+    if not tokens:
+        return name.lower().strip()
+    return " ".join(tokens)
+
+def ingredient_names(line: str):
+    """
+    Bare food names in a recipe ingredient line, in canonical_key form:
+    "2 cups cooked rice" -> ["rice"], "salt and pepper" -> ["salt", "pepper"].
+    """
+    line = re.sub(r"\([^)]*\)", " ", line.lower())
+    names = []
+    for part in re.split(r",|;|&|\band\b|\bor\b", line):
+        tokens = [token for token in tokenize(part) if token not in RECIPE_WORDS]
+        if tokens:
+            names.append(" ".join(dict.fromkeys(tokens)))
+    return names
+
+def _ngrams(key: str):
+    padded = f" {key} "
+    return [padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)]
+
+def _features(key: str):
+    # Character n-grams barely see word order, so the head word (the food itself,
+    # last in English) is an extra feature: "milk chocolate" stays away from "chocolate milk"
+    features = _ngrams(key)
+    words = key.split()
+    if words:
+        features += ["^" + words[-1]] * HEAD_WEIGHT
+    return features
+
+class SimilarityIndex:
+    """
+    Character n-gram TF-IDF index stored as flat (doc, gram, weight) arrays so a
+    query is one vectorized bincount over the non-zeros, not a dense matrix product.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.keys = []
+        self._vocab = {}
+        self._dirty = True
+        self._doc_ids = None
+        self._gram_ids = None
+        self._weights = None
+        self._idf = None
+
+    def add(self, food_id: int, key: str):
+        self.ids.append(food_id)
+        self.keys.append(key)
+        self._dirty = True
+
+    def _gram_id(self, gram: str):
+        gram_id = self._vocab.get(gram)
+        if gram_id is None:
+            gram_id = self._vocab[gram] = len(self._vocab)
+        return gram_id
+
+    def _rebuild(self):
+        # NumPy is imported on first use so it stays off the API's import path
+        import numpy as np
+        doc_ids, gram_ids, tfs = [], [], []
+        for doc, key in enumerate(self.keys):
+            for gram, count in Counter(_features(key)).items():
+                doc_ids.append(doc)
+                gram_ids.append(self._gram_id(gram))
+                tfs.append(count)
+        self._doc_ids = np.array(doc_ids, dtype=np.int64)
+        self._gram_ids = np.array(gram_ids, dtype=np.int64)
+
+        df = np.bincount(self._gram_ids, minlength=len(self._vocab))
+        self._idf = np.log((1 + len(self.keys)) / (1 + df)) + 1.0
+        weights = np.array(tfs, dtype=np.float64) * self._idf[self._gram_ids]
+        norms = np.sqrt(np.bincount(self._doc_ids, weights=weights ** 2, minlength=len(self.keys)))
+        self._weights = weights / norms[self._doc_ids]
+        self._dirty = False
+
+    def best_match(self, key: str):
+        """
+        Returns (food_id, score) for the most similar known key, or (None, 0.0).
+        """
+        if not self.keys:
+            return None, 0.0
+        if self._dirty:
+            self._rebuild()
+
+        import numpy as np
+        query = np.zeros(len(self._vocab))
+        norm_sq = 0.0
+        unseen_idf = math.log(1 + len(self.keys)) + 1.0
+        for gram, count in Counter(_features(key)).items():
+            gram_id = self._vocab.get(gram)
+            if gram_id is None:
+                # Grams the index has never seen still count towards the query's length
+                norm_sq += (count * unseen_idf) ** 2
+                continue
+            query[gram_id] = count * self._idf[gram_id]
+            norm_sq += query[gram_id] ** 2
+        if not query.any():
+            return None, 0.0
+        query /= math.sqrt(norm_sq)
+
+        scores = np.bincount(self._doc_ids, weights=self._weights * query[self._gram_ids], minlength=len(self.keys))
+        best = int(np.argmax(scores))
+        return self.ids[best], float(scores[best])
+
+_index = SimilarityIndex()
+_by_key = {}
+_loaded = False
+_lock = threading.Lock()
+
+def _load():
+    global _loaded
+    db = SessionLocal()
+    try:
+        for food_id, key in db.query(models.CanonicalFood.id, models.CanonicalFood.key).all():
+            _by_key[key] = food_id
+            _index.add(food_id, key)
+    finally:
+        db.close()
+    _loaded = True
+
+def find(name: str):
+    """
+    Like resolve(), but returns None instead of creating an unknown food.
+    """
+    key = canonical_key(name)
+    with _lock:
+        if not _loaded:
+            _load()
+        if key in _by_key:
+            return _by_key[key]
+        food_id, score = _index.best_match(key)
+        if food_id is not None and score >= SIMILARITY_THRESHOLD:
+            return food_id
+        return None
+
+def resolve(name: str):
+    """
+    Canonical food id for `name`, creating a new canonical food if nothing known
+    is close enough. New foods are committed in their own session so the id
+    stays valid even if the caller's transaction rolls back.
+    """
+    key = canonical_key(name)
+    with _lock:
+        if not _loaded:
+            _load()
+        if key in _by_key:
+            return _by_key[key]
+
+        food_id, score = _index.best_match(key)
+        if food_id is not None and score >= SIMILARITY_THRESHOLD:
+            _by_key[key] = food_id
+            return food_id
+
+        db = SessionLocal()
+        try:
+            db_food = models.CanonicalFood(key=key, name=name.strip())
+            db.add(db_food)
+            try:
+                db.commit()
+                food_id = db_food.id
+            except IntegrityError:
+                # Another process (API worker, init_db.py) created this key after we loaded
+                db.rollback()
+                food_id = db.query(models.CanonicalFood.id).filter(models.CanonicalFood.key == key).scalar()
+        finally:
+            db.close()
+        _by_key[key] = food_id
+        _index.add(food_id, key)
+        return food_id
@@ -1,7 +1,105 @@
+from sqlalchemy import Float, Integer, String, cast, func, text, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import models, schemas
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
+import re
 import ai_service
+import events
+import canonical
+
+def record_inventory_change(db: Session, user_id: int, entity: str, entity_id: int, op: str, fridge_id: int = None, data: dict = None):
+    """
+    Bump the user's inventory version, log the change for the /changes feed and
+    queue a push event for WebSocket subscribers.
+    Must be called before the caller commits so the bump lands in the same transaction.
+    """
+    # Increment in the database rather than read-modify-write: the UPDATE takes the
+    # write lock (SQLite has no SELECT ... FOR UPDATE), so concurrent writers serialize
+    version = db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(inventory_version=func.coalesce(models.User.inventory_version, 0) + 1)
+        .returning(models.User.inventory_version)
+    ).scalar()
+    if version is None:
+        return None
+
+    if fridge_id is not None:
+        db_fridge = db.query(models.Fridge).filter(models.Fridge.id == fridge_id).first()
+        if db_fridge is not None:
+            db_fridge.version = version
+
+    db.add(models.InventoryChange(
+        user_id=user_id,
+        version=version,
+        entity=entity,
+        entity_id=entity_id,
+        fridge_id=fridge_id,
+        op=op
+    ))
+    events.publish_on_commit(db, user_id, {
+        "type": f"{entity}.{op}",
+        "version": version,
+        "entity_id": entity_id,
+        "fridge_id": fridge_id,
+        "data": data
+    })
+    return version
+
+def get_inventory_version(db: Session, user_id: int):
+    version = db.query(models.User.inventory_version).filter(models.User.id == user_id).scalar()
+    return version or 0
+
+def get_changes(db: Session, user_id: int, since: int = 0):
+    """
+    Return the net changes after `since`, one entry per entity (latest op wins),
+    with the current row attached for anything that still exists.
+    """
+    rows = db.query(models.InventoryChange).filter(
+        models.InventoryChange.user_id == user_id,
+        models.InventoryChange.version > since
+    ).order_by(models.InventoryChange.version).all()
+
+    latest = {}
+    for row in rows:
+        latest[(row.entity, row.entity_id)] = row
+
+    item_ids = [entity_id for (entity, entity_id), row in latest.items() if entity == "item" and row.op != "deleted"]
+    fridge_ids = [entity_id for (entity, entity_id), row in latest.items() if entity == "fridge" and row.op != "deleted"]
+    items = {}
+    if item_ids:
+        # Items orphaned by fridge deletes before they were cleaned up count as gone
+        items = {i.id: i for i in db.query(models.Item).filter(
+            models.Item.id.in_(item_ids),
+            models.Item.fridge_id != None
+        ).all()}
+    fridges = {}
+    if fridge_ids:
+        fridges = {f.id: f for f in db.query(models.Fridge).filter(models.Fridge.id.in_(fridge_ids)).all()}
+
+    changes = []
+    for row in sorted(latest.values(), key=lambda r: r.version):
+        change = {
+            "version": row.version,
+            "entity": row.entity,
+            "entity_id": row.entity_id,
+            "fridge_id": row.fridge_id,
+            "op": row.op,
+            "item": None,
+            "fridge": None
+        }
+        if row.op != "deleted":
+            if row.entity == "item":
+                change["item"] = items.get(row.entity_id)
+            else:
+                change["fridge"] = fridges.get(row.entity_id)
+            # Row no longer exists (or lost its fridge); report it as gone
+            if change["item"] is None and change["fridge"] is None:
+                change["op"] = "deleted"
+        changes.append(change)
+
+    return {"version": get_inventory_version(db, user_id), "changes": changes}
 
 def get_expiring_items(db: Session, user_id: int):
     today = date.today()
@@ -21,6 +119,16 @@ def get_all_user_items(db: Session, user_id: int):
         models.Fridge.user_id == user_id
     ).all()
 
+def get_user_items_by_fridge(db: Session, user_id: int):
+    """
+    All of a user's fridges plus {fridge_id: [items]}, with every item loaded in one query.
+    """
+    fridges = db.query(models.Fridge).filter(models.Fridge.user_id == user_id).order_by(models.Fridge.id).all()
+    items_by_fridge = {fridge.id: [] for fridge in fridges}
+    for item in get_all_user_items(db, user_id):
+        items_by_fridge[item.fridge_id].append(item)
+    return fridges, items_by_fridge
+
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 def get_user_by_email(db: Session, email: str):
@@ -40,6 +148,9 @@ def get_fridges(db: Session, user_id: int, skip: int = 0, limit: int = 100):
 def create_user_fridge(db: Session, fridge: schemas.FridgeCreate, user_id: int):
     db_fridge = models.Fridge(**fridge.dict(), user_id=user_id)
     db.add(db_fridge)
+    db.flush()
+    record_inventory_change(db, user_id, "fridge", db_fridge.id, "created", fridge_id=db_fridge.id,
+                            data=schemas.FridgeSummary.model_validate(db_fridge).model_dump(mode="json"))
     db.commit()
     db.refresh(db_fridge)
     return db_fridge
@@ -47,6 +158,11 @@ def create_user_fridge(db: Session, fridge: schemas.FridgeCreate, user_id: int):
 def delete_fridge(db: Session, fridge_id: int, user_id: int):
     db_fridge = db.query(models.Fridge).filter(models.Fridge.id == fridge_id, models.Fridge.user_id == user_id).first()
     if db_fridge:
+        # Fridge.items doesn't cascade, so delete (and announce) the items explicitly
+        for db_item in list(db_fridge.items):
+            record_inventory_change(db, user_id, "item", db_item.id, "deleted", fridge_id=db_fridge.id)
+            db.delete(db_item)
+        record_inventory_change(db, user_id, "fridge", db_fridge.id, "deleted")
         db.delete(db_fridge)
         db.commit()
     return db_fridge
@@ -57,18 +173,77 @@ def get_fridge(db: Session, fridge_id: int, user_id: int):
 def get_items(db: Session, fridge_id: int, skip: int = 0, limit: int = 100):
     return db.query(models.Item).filter(models.Item.fridge_id == fridge_id).offset(skip).limit(limit).all()
 
+def _scale_nutrition(nutrition: dict, factor: float, digits: int = None):
+    """
+    Multiply every numeric value by `factor`. With `digits`, results are rounded
+    and whole numbers come back as ints; the per-unit cache is stored unrounded.
+    """
+    scaled = {}
+    for key, value in nutrition.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = value * factor
+            if digits is not None:
+                value = round(value, digits)
+                if value.is_integer():
+                    value = int(value)
+        scaled[key] = value
+    return scaled
+
+def get_nutrition(db: Session, canonical_id: int, name: str, quantity: float, unit: str = None, notes: str = None):
+    """
+    Nutrition for `quantity` `unit` of a canonical food, scaled from the per-unit
+    cache when this food/unit has been looked up before. Notes make an item
+    specific, so those lookups always go to the AI.
+    """
+    unit_key = (unit or "").strip().lower()
+    cacheable = canonical_id is not None and not notes and bool(quantity)
+    if cacheable:
+        cached = db.query(models.NutritionCache).filter(
+            models.NutritionCache.canonical_id == canonical_id,
+            models.NutritionCache.unit == unit_key
+        ).first()
+        if cached:
+            return _scale_nutrition(cached.per_unit, quantity, digits=2)
+
+    nutrition = ai_service.get_nutrition_info(name, quantity, unit, notes)
+    # Without a client get_nutrition_info returns placeholder numbers; don't cache those
+    if nutrition and cacheable and ai_service.get_client():
+        db.add(models.NutritionCache(
+            canonical_id=canonical_id,
+            unit=unit_key,
+            per_unit=_scale_nutrition(nutrition, 1 / quantity)
+        ))
+    return nutrition
+
+def backfill_canonical_ids(db: Session):
+    items = db.query(models.Item).filter(models.Item.canonical_id == None).all()
+    for db_item in items:
+        db_item.canonical_id = canonical.resolve(db_item.name)
+    db.commit()
+    return len(items)
+
 def create_fridge_item(db: Session, item: schemas.ItemCreate, fridge_id: int):
+    enriched = False
+    canonical_id = canonical.resolve(item.name)
     # Fetch nutrition info if not provided
     if not item.nutritional_info:
         item_data = item.dict()
-        nutrition = ai_service.get_nutrition_info(item.name, item.quantity, item.unit, item.notes)
+        nutrition = get_nutrition(db, canonical_id, item.name, item.quantity, item.unit, item.notes)
         if nutrition:
             item_data['nutritional_info'] = nutrition
-        db_item = models.Item(**item_data, fridge_id=fridge_id)
+            enriched = True
+        db_item = models.Item(**item_data, fridge_id=fridge_id, canonical_id=canonical_id)
     else:
-        db_item = models.Item(**item.dict(), fridge_id=fridge_id)
+        db_item = models.Item(**item.dict(), fridge_id=fridge_id, canonical_id=canonical_id)
         
     db.add(db_item)
+    db.flush()
+    user_id = db.query(models.Fridge.user_id).filter(models.Fridge.id == fridge_id).scalar()
+    item_data = schemas.Item.model_validate(db_item).model_dump(mode="json")
+    record_inventory_change(db, user_id, "item", db_item.id, "created", fridge_id=fridge_id, data=item_data)
+    if enriched:
+        events.publish_on_commit(db, user_id, {"type": "nutrition.enriched", "item_id": db_item.id,
+                                               "fridge_id": fridge_id, "nutritional_info": item_data["nutritional_info"]})
     db.commit()
     db.refresh(db_item)
     return db_item
@@ -86,7 +261,13 @@ def update_item(db: Session, item_id: int, item_update: schemas.ItemUpdate):
     # But to keep it simple and per user request: "allow for comments... so AI has more context to update"
     # This implies we SHOULD re-fetch if notes/name/quantity/unit change.
     
+    enriched = False
     relevant_changes = any(k in update_data for k in ['name', 'quantity', 'unit', 'notes'])
+
+    canonical_id = db_item.canonical_id
+    if 'name' in update_data or canonical_id is None:
+        canonical_id = canonical.resolve(update_data.get('name', db_item.name))
+        update_data['canonical_id'] = canonical_id
     
     if relevant_changes and 'nutritional_info' not in update_data:
         # Re-fetch nutrition with new context
@@ -95,14 +276,22 @@ def update_item(db: Session, item_id: int, item_update: schemas.ItemUpdate):
         unit = update_data.get('unit', db_item.unit)
         notes = update_data.get('notes', db_item.notes)
         
-        nutrition = ai_service.get_nutrition_info(name, quantity, unit, notes)
+        nutrition = get_nutrition(db, canonical_id, name, quantity, unit, notes)
         if nutrition:
             update_data['nutritional_info'] = nutrition
+            enriched = True
 
     for key, value in update_data.items():
         setattr(db_item, key, value)
 
     db.add(db_item)
+    if db_item.fridge:
+        user_id = db_item.fridge.user_id
+        item_data = schemas.Item.model_validate(db_item).model_dump(mode="json")
+        record_inventory_change(db, user_id, "item", db_item.id, "updated", fridge_id=db_item.fridge_id, data=item_data)
+        if enriched:
+            events.publish_on_commit(db, user_id, {"type": "nutrition.enriched", "item_id": db_item.id,
+                                                   "fridge_id": db_item.fridge_id, "nutritional_info": item_data["nutritional_info"]})
     db.commit()
     db.refresh(db_item)
     return db_item
@@ -110,25 +299,244 @@ def update_item(db: Session, item_id: int, item_update: schemas.ItemUpdate):
 def delete_item(db: Session, item_id: int):
     db_item = db.query(models.Item).filter(models.Item.id == item_id).first()
     if db_item:
+        if db_item.fridge:
+            record_inventory_change(db, db_item.fridge.user_id, "item", db_item.id, "deleted", fridge_id=db_item.fridge_id)
         db.delete(db_item)
         db.commit()
     return db_item
 
+def parse_minutes(time_text: str):
+    """
+    "1 hr 15 mins" -> 75, "45 minutes" -> 45, "1.5 hours" -> 90, "1h30" -> 90, "20" -> 20.
+    Returns None when nothing numeric is found.
+    """
+    if not time_text:
+        return None
+    text_lower = time_text.lower()
+    # (?![a-z]) instead of \b so "1h30" still counts as an hour
+    hours = re.search(r"(\d+(?:\.\d+)?)\s*(?:hours|hour|hrs|hr|h)(?![a-z])\s*(\d+)?", text_lower)
+    minutes = re.search(r"(\d+)\s*(?:minutes|minute|mins|min|m)(?![a-z])", text_lower)
+    if hours or minutes:
+        total = float(hours.group(1)) * 60 if hours else 0
+        if minutes:
+            total += int(minutes.group(1))
+        elif hours.group(2):
+            # Unitless number right after the hours, as in "1h30"
+            total += int(hours.group(2))
+        return int(round(total))
+    bare = re.search(r"\d+", text_lower)
+    return int(bare.group(0)) if bare else None
+
+def _uses_fts(db: Session):
+    # The FTS5 table is created by init_db.py on SQLite; other databases fall back to LIKE
+    return db.get_bind().dialect.name == "sqlite"
+
+def _build_ingredients(matching_ingredients, missing_ingredients):
+    """
+    One row per food named in the recipe's ingredient lines. Recipe text never
+    creates canonical foods; names with no known match get a NULL canonical_id
+    and are still searchable by name.
+    """
+    return [
+        models.RecipeIngredient(name=name, canonical_id=canonical.find(name), missing=missing)
+        for lines, missing in ((matching_ingredients or [], False), (missing_ingredients or [], True))
+        for line in lines
+        for name in canonical.ingredient_names(line)
+    ]
+
+def _index_recipe_text(db: Session, db_recipe: models.Recipe):
+    if not _uses_fts(db):
+        return
+    db.execute(text("DELETE FROM recipes_fts WHERE rowid = :id"), {"id": db_recipe.id})
+    db.execute(
+        text("INSERT INTO recipes_fts (rowid, title, instructions) VALUES (:id, :title, :instructions)"),
+        {"id": db_recipe.id, "title": db_recipe.title or "", "instructions": "\n".join(db_recipe.instructions or [])}
+    )
+
+def reindex_recipes(db: Session):
+    """
+    Rebuild the ingredient join rows, parsed times and full-text entries for every saved recipe.
+    """
+    recipes = db.query(models.Recipe).all()
+    # Look ingredients up before writing anything
+    ingredients = {r.id: _build_ingredients(r.matching_ingredients, r.missing_ingredients) for r in recipes}
+    for db_recipe in recipes:
+        db_recipe.time_minutes = parse_minutes(db_recipe.time)
+        db_recipe.ingredients = ingredients[db_recipe.id]
+        _index_recipe_text(db, db_recipe)
+    db.commit()
+    return len(recipes)
+
 def create_recipe(db: Session, recipe: schemas.RecipeCreate, user_id: int):
     # Pass dict since we have lists/dicts in JSON columns
     recipe_data = recipe.dict()
-    db_recipe = models.Recipe(**recipe_data, user_id=user_id)
+    # Look ingredients up before writing anything
+    ingredients = _build_ingredients(recipe.matching_ingredients, recipe.missing_ingredients)
+    db_recipe = models.Recipe(**recipe_data, user_id=user_id, time_minutes=parse_minutes(recipe.time),
+                              ingredients=ingredients)
     db.add(db_recipe)
+    db.flush()
+    _index_recipe_text(db, db_recipe)
     db.commit()
     db.refresh(db_recipe)
     return db_recipe
 
-def get_recipes(db: Session, user_id: int):
-    return db.query(models.Recipe).filter(models.Recipe.user_id == user_id).all()
-
 def delete_recipe(db: Session, recipe_id: int, user_id: int):
     db_recipe = db.query(models.Recipe).filter(models.Recipe.id == recipe_id, models.Recipe.user_id == user_id).first()
     if db_recipe:
+        if _uses_fts(db):
+            db.execute(text("DELETE FROM recipes_fts WHERE rowid = :id"), {"id": db_recipe.id})
         db.delete(db_recipe)
         db.commit()
     return db_recipe
+
+def get_insight(db: Session, user_id: int, kind: str, fridge_id: int = None):
+    return db.query(models.Insight).filter(
+        models.Insight.user_id == user_id,
+        models.Insight.kind == kind,
+        models.Insight.fridge_id == fridge_id
+    ).first()
+
+def save_insight(db: Session, user_id: int, kind: str, inventory_version: int, payload, fridge_id: int = None):
+    """
+    Insert or update the insight for (user, kind, fridge). If a concurrent writer
+    (batch job, another request) inserted it first, update theirs instead.
+    """
+    for attempt in range(2):
+        db_insight = get_insight(db, user_id, kind, fridge_id)
+        if db_insight is None:
+            db_insight = models.Insight(user_id=user_id, kind=kind, fridge_id=fridge_id)
+        db_insight.inventory_version = inventory_version
+        db_insight.payload = payload
+        db_insight.generated_at = datetime.now()
+        db.add(db_insight)
+        try:
+            db.commit()
+            break
+        except IntegrityError:
+            db.rollback()
+            if attempt:
+                raise
+    db.refresh(db_insight)
+    return db_insight
+
+def get_users_with_stale_insights(db: Session, generated_before: datetime):
+    """
+    Users whose recipe insight is missing, was built from an older inventory
+    version, or is older than `generated_before`, plus users with a non-empty
+    fridge whose health insight is missing or stale in the same way (e.g. a
+    health generation failed while the recipe one succeeded).
+    """
+    recipes = db.query(models.Insight).filter(
+        models.Insight.kind == "recipes",
+        models.Insight.fridge_id == None
+    ).subquery()
+    fresh_health = db.query(models.Insight.id).filter(
+        models.Insight.kind == "health",
+        models.Insight.fridge_id == models.Fridge.id,
+        models.Insight.inventory_version == models.Fridge.version,
+        models.Insight.generated_at >= generated_before
+    ).exists()
+    stale_fridge = db.query(models.Fridge.id).filter(
+        models.Fridge.user_id == models.User.id,
+        db.query(models.Item.id).filter(models.Item.fridge_id == models.Fridge.id).exists(),
+        ~fresh_health
+    ).exists()
+    return db.query(models.User).outerjoin(recipes, recipes.c.user_id == models.User.id).filter(
+        (recipes.c.id == None)
+        | (recipes.c.inventory_version != models.User.inventory_version)
+        | (recipes.c.generated_at < generated_before)
+        | stale_fridge
+    ).all()
+
+# Lean read path: select only the requested columns and return plain dicts,
+# skipping ORM object construction and Pydantic validation on large lists.
+def _project(query):
+    return [dict(row._mapping) for row in query.all()]
+
+def _columns(model, fields):
+    return [getattr(model, field) for field in fields]
+
+def get_item_rows(db: Session, fridge_id: int, fields, skip: int = 0, limit: int = 100):
+    query = db.query(*_columns(models.Item, fields)).filter(models.Item.fridge_id == fridge_id)
+    return _project(query.order_by(models.Item.id).offset(skip).limit(limit))
+
+def get_expiring_item_rows(db: Session, user_id: int, fields):
+    limit_date = date.today() + timedelta(days=3)
+    query = db.query(*_columns(models.Item, fields)).join(models.Fridge).filter(
+        models.Fridge.user_id == user_id,
+        models.Item.expiration_date != None,
+        models.Item.expiration_date <= limit_date
+    )
+    return _project(query.order_by(models.Item.id))
+
+def get_fridge_rows(db: Session, user_id: int, fields, item_fields, skip: int = 0, limit: int = 100):
+    """
+    Fridges with their items nested, in two queries regardless of fridge count.
+    `fields` must include "id"; items are only loaded when "items" is requested.
+    """
+    fridge_fields = [f for f in fields if f != "items"]
+    query = db.query(*_columns(models.Fridge, fridge_fields)).filter(models.Fridge.user_id == user_id)
+    fridges = _project(query.order_by(models.Fridge.id).offset(skip).limit(limit))
+    if "items" not in fields or not fridges:
+        return fridges
+
+    by_fridge = {fridge["id"]: fridge for fridge in fridges}
+    for fridge in fridges:
+        fridge["items"] = []
+
+    columns = _columns(models.Item, item_fields)
+    if "fridge_id" not in item_fields:
+        columns.append(models.Item.fridge_id)
+    item_query = db.query(*columns).filter(models.Item.fridge_id.in_(by_fridge.keys())).order_by(models.Item.id)
+    for row in item_query.all():
+        item = dict(row._mapping)
+        fridge_id = item["fridge_id"] if "fridge_id" in item_fields else item.pop("fridge_id")
+        by_fridge[fridge_id]["items"].append(item)
+    return fridges
+
+def get_recipe_rows(db: Session, user_id: int, fields, skip: int = 0, limit: int = 100):
+    query = db.query(*_columns(models.Recipe, fields)).filter(models.Recipe.user_id == user_id)
+    return _project(query.order_by(models.Recipe.id).offset(skip).limit(limit))
+
+def search_recipe_rows(db: Session, user_id: int, fields, q: str = None, ingredients=None,
+                       difficulty: str = None, max_minutes: int = None, skip: int = 0, limit: int = 20):
+    """
+    Saved recipes matching every given filter. `q` is matched against title and
+    instructions (ranked by relevance), `ingredients` must all be used by the recipe.
+    """
+    query = db.query(*_columns(models.Recipe, fields)).filter(models.Recipe.user_id == user_id)
+
+    # Normalize filters the way ingredient lines were stored: "minced garlic" -> "garlic"
+    names = [n for ingredient in ingredients or []
+             for n in canonical.ingredient_names(ingredient) or [canonical.canonical_key(ingredient)]]
+    for name in dict.fromkeys(names):
+        matches = models.RecipeIngredient.name == name
+        canonical_id = canonical.find(name)
+        if canonical_id is not None:
+            matches = matches | (models.RecipeIngredient.canonical_id == canonical_id)
+        query = query.filter(models.Recipe.id.in_(
+            db.query(models.RecipeIngredient.recipe_id).filter(matches)
+        ))
+
+    if difficulty:
+        query = query.filter(models.Recipe.difficulty.ilike(difficulty))
+    if max_minutes is not None:
+        query = query.filter(models.Recipe.time_minutes <= max_minutes)
+
+    terms = (q or "").split()
+    if terms and _uses_fts(db):
+        # Quote each term so user input can't inject FTS5 query syntax; terms are ANDed
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        fts = text(
+            "SELECT rowid AS recipe_id, bm25(recipes_fts) AS rank FROM recipes_fts WHERE recipes_fts MATCH :match"
+        ).bindparams(match=match).columns(recipe_id=Integer, rank=Float).subquery("fts")
+        query = query.join(fts, fts.c.recipe_id == models.Recipe.id).order_by(fts.c.rank, models.Recipe.id)
+    else:
+        for term in terms:
+            like = f"%{term}%"
+            # instructions is a JSON column; Postgres has no ILIKE for json, so compare its text form
+            query = query.filter(models.Recipe.title.ilike(like) | cast(models.Recipe.instructions, String).ilike(like))
+        query = query.order_by(models.Recipe.id)
+
+    return _project(query.offset(skip).limit(limit))
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+from datetime import date
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Per-subscriber queue size. A client that falls this far behind gets a single
+# "resync" event instead of an ever-growing backlog.
+MAX_QUEUE_SIZE = 100
+
+class Subscriber:
+    def __init__(self, user_id: int, maxsize: int = MAX_QUEUE_SIZE):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+class EventHub:
+    """
+    In-process pub/sub for inventory events.
+    publish() is safe to call from the worker threads that run sync endpoints;
+    delivery always happens on the event loop the hub was bound to.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def bind(self, loop):
+        self._loop = loop
+
+    def subscribe(self, user_id: int):
+        subscriber = Subscriber(user_id)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.user_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.user_id]
+
+    def subscribed_users(self):
+        with self._lock:
+            return list(self._subscribers.keys())
+
+    def publish(self, user_id: int, payload: dict):
+        if self._loop is None or self._loop.is_closed():
+            return
+        with self._lock:
+            if user_id not in self._subscribers:
+                return
+        self._loop.call_soon_threadsafe(self._deliver, user_id, payload)
+
+    def _deliver(self, user_id: int, payload: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Slow consumer: drop the backlog and tell the client to catch up via /changes
+                subscriber.dropped += subscriber.queue.qsize()
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait({"type": "resync"})
+
+hub = EventHub()
+
+def publish_on_commit(db: Session, user_id: int, payload: dict):
+    """
+    Queue an event to be published once `db` commits, so subscribers never
+    hear about a write that was rolled back.
+    """
+    db.info.setdefault("pending_events", []).append((user_id, payload))
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session):
+    for user_id, payload in session.info.pop("pending_events", []):
+        hub.publish(user_id, payload)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop("pending_events", None)
+
+async def watch_expiry(load_expiring, interval: int = 3600):
+    """
+    Periodically diff each subscribed user's expiring items and publish
+    "item.expiring" / "item.expired" when an item crosses a threshold.
+    `load_expiring(user_id)` is a blocking call returning the expiring items.
+    """
+    known = {}
+    while True:
+        today = date.today()
+        for user_id in hub.subscribed_users():
+            try:
+                items = await asyncio.to_thread(load_expiring, user_id)
+            except Exception as e:
+                print(f"Expiry watcher error: {e}")
+                continue
+
+            current = {}
+            for item in items:
+                current[item.id] = "expired" if item.expiration_date < today else "expiring"
+
+            previous = known.get(user_id)
+            known[user_id] = current
+            if previous is None:
+                # First pass for this user only establishes the baseline
+                continue
+
+            for item in items:
+                state = current[item.id]
+                if previous.get(item.id) != state:
+                    hub.publish(user_id, {
+                        "type": f"item.{state}",
+                        "item_id": item.id,
+                        "fridge_id": item.fridge_id,
+                        "name": item.name,
+                        "expiration_date": item.expiration_date.isoformat()
+                    })
+
+        for user_id in list(known.keys()):
+            if user_id not in hub.subscribed_users():
+                del known[user_id]
+
+        await asyncio.sleep(interval)
@@ -0,0 +1,55 @@
+"""
+Creates the schema, applies column migrations and seeds the test user.
+Run once before starting the API (and after pulling schema changes):
+
+    python init_db.py
+
+This used to happen on import/startup of main.py, which slowed down every
+worker cold start and every test process.
+"""
+from sqlalchemy import text
+
+import models, schemas, crud
+from database import SessionLocal, engine
+import migrate_db
+
+def create_search_index():
+    """
+    FTS5 index over recipe titles and instructions (rowid = recipes.id).
+    create_all can't create virtual tables, so it's done here. SQLite only.
+    """
+    if engine.dialect.name != "sqlite":
+        return False
+    with engine.begin() as conn:
+        exists = conn.execute(text("SELECT name FROM sqlite_master WHERE name = 'recipes_fts'")).first()
+        if not exists:
+            conn.execute(text("CREATE VIRTUAL TABLE recipes_fts USING fts5(title, instructions, tokenize = 'porter unicode61')"))
+    return not exists
+
+def init_db():
+    # Creates any missing tables; existing tables get new columns from migrate_db
+    models.Base.metadata.create_all(bind=engine)
+    migrate_db.migrate()
+    new_index = create_search_index()
+
+    db = SessionLocal()
+    try:
+        test_email = "test@example.com"
+        user = crud.get_user_by_email(db, email=test_email)
+        if not user:
+            user_in = schemas.UserCreate(email=test_email, password="password123")
+            crud.create_user(db, user=user_in)
+            print(f"Created test user: {test_email} / password123")
+
+        backfilled = crud.backfill_canonical_ids(db)
+        if backfilled:
+            print(f"Assigned canonical food ids to {backfilled} items.")
+
+        if new_index:
+            reindexed = crud.reindex_recipes(db)
+            print(f"Indexed {reindexed} saved recipes for search.")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    init_db()
@@ -0,0 +1,105 @@
+"""
+Precomputes AI insights (per-fridge health analysis and recipe suggestions)
+for users whose inventory changed since they were last generated.
+
+Run once:       python insights.py
+Run on a timer: python insights.py --every 86400
+The API can also run it in-process by setting INSIGHTS_INTERVAL (seconds).
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import crud
+import ai_service
+from database import SessionLocal
+
+MAX_AGE = timedelta(days=1)
+DEFAULT_CONCURRENCY = 4
+
+def is_fresh(insight, inventory_version: int):
+    return (
+        insight is not None
+        and insight.inventory_version == inventory_version
+        and datetime.now() - insight.generated_at < MAX_AGE
+    )
+
+def is_usable(kind: str, payload):
+    # ai_service returns a score-0 placeholder / empty list on failure; don't cache those
+    if kind == "health":
+        return bool(payload and payload.get("score"))
+    return bool(payload)
+
+def plan_jobs(db):
+    """
+    Collect (kind, user_id, fridge_id, inventory_version, items) for every stale insight.
+    """
+    jobs = []
+    for user in crud.get_users_with_stale_insights(db, generated_before=datetime.now() - MAX_AGE):
+        all_items = []
+        fridges, items_by_fridge = crud.get_user_items_by_fridge(db, user_id=user.id)
+        for fridge in fridges:
+            items = items_by_fridge[fridge.id]
+            all_items.extend(items)
+            if items and not is_fresh(crud.get_insight(db, user.id, "health", fridge.id), fridge.version):
+                jobs.append(("health", user.id, fridge.id, fridge.version, items))
+        if all_items and not is_fresh(crud.get_insight(db, user.id, "recipes"), user.inventory_version):
+            jobs.append(("recipes", user.id, None, user.inventory_version, all_items))
+    return jobs
+
+def generate(kind: str, items: list):
+    if kind == "health":
+        return ai_service.analyze_fridge_health(items)
+    return ai_service.generate_recipes(items)
+
+def run_batch(concurrency: int = DEFAULT_CONCURRENCY):
+    """
+    Generate every stale insight with at most `concurrency` AI calls in flight.
+    AI calls run on worker threads; all DB writes stay on the calling thread.
+    """
+    start_time = time.time()
+    db = SessionLocal()
+    stats = {"generated": 0, "failed": 0}
+    try:
+        jobs = plan_jobs(db)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(generate, job[0], job[4]): job for job in jobs}
+            for future in as_completed(futures):
+                kind, user_id, fridge_id, inventory_version, _ = futures[future]
+                try:
+                    payload = future.result()
+                except Exception as e:
+                    print(f"Insight generation error ({kind}, user {user_id}): {e}")
+                    payload = None
+                if not is_usable(kind, payload):
+                    stats["failed"] += 1
+                    continue
+                crud.save_insight(db, user_id, kind, inventory_version, payload, fridge_id=fridge_id)
+                stats["generated"] += 1
+    finally:
+        db.close()
+
+    print(f"Insights batch: {stats['generated']} generated, {stats['failed']} failed "
+          f"in {time.time() - start_time:.2f} seconds.")
+    return stats
+
+async def run_scheduler(interval: int, concurrency: int = DEFAULT_CONCURRENCY):
+    while True:
+        try:
+            await asyncio.to_thread(run_batch, concurrency)
+        except Exception as e:
+            print(f"Insights batch crashed: {e}")
+        await asyncio.sleep(interval)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute AI insights for changed inventories.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--every", type=int, default=None, help="Keep running, every N seconds.")
+    args = parser.parse_args()
+
+    if args.every:
+        asyncio.run(run_scheduler(args.every, args.concurrency))
+    else:
+        run_batch(args.concurrency)
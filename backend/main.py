@@ -1,15 +1,32 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import time
+import orjson
 
 import models, schemas, crud
-from database import SessionLocal, engine
+from database import SessionLocal
 import ai_service
+import events
+import insights
+import os
 
-models.Base.metadata.create_all(bind=engine)
+# Max Gemini calls in flight for one /fridges/analysis request
+ANALYSIS_CONCURRENCY = 4
 
-app = FastAPI(title="MyFridgePal API")
+# Schema creation and seeding live in init_db.py (run it before starting the API)
+
+class ORJSONResponse(JSONResponse):
+    # orjson serializes dates and the nutritional_info dicts natively and much faster than json
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+app = FastAPI(title="MyFridgePal API", default_response_class=ORJSONResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -18,6 +35,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Dependency
@@ -28,17 +46,82 @@ def get_db():
     finally:
         db.close()
 
-# Startup event to seed test user
-@app.on_event("startup")
-def startup_event():
+def check_etag(request: Request, response: Response, etag: str):
+    """
+    Tag the response with `etag` and return a 304 if the client's If-None-Match already matches.
+    `no-cache` makes browsers revalidate every time instead of re-downloading.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in tags or etag in tags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def parse_fields(fields: Optional[str], schema):
+    """
+    Turn a `fields=a,b,c` sparse fieldset into a tuple of column names.
+    Defaults to every field on `schema`; "id" is always included.
+    """
+    allowed = tuple(schema.model_fields)
+    if not fields:
+        return allowed
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    if "id" not in requested:
+        requested.insert(0, "id")
+    return tuple(dict.fromkeys(requested))
+
+def lean_response(content, response: Response):
+    # Returning a Response skips response_model validation, so carry the ETag headers over by hand
+    headers = {key: response.headers[key] for key in ("etag", "cache-control") if key in response.headers}
+    return ORJSONResponse(content, headers=headers)
+
+def inventory_etag(db: Session, user_id: int):
+    return f'W/"inv-{crud.get_inventory_version(db, user_id)}"'
+
+def fridge_etag(db_fridge: models.Fridge):
+    return f'W/"fridge-{db_fridge.id}-{db_fridge.version or 0}"'
+
+def load_expiring_items(user_id: int):
+    db = SessionLocal()
+    try:
+        return crud.get_expiring_items(db, user_id=user_id)
+    finally:
+        db.close()
+
+def load_inventory_version(user_id: int):
     db = SessionLocal()
-    test_email = "test@example.com"
-    user = crud.get_user_by_email(db, email=test_email)
-    if not user:
-        user_in = schemas.UserCreate(email=test_email, password="password123")
-        crud.create_user(db, user=user_in)
-        print(f"Created test user: {test_email} / password123")
-    db.close()
+    try:
+        return crud.get_inventory_version(db, user_id=user_id)
+    finally:
+        db.close()
+
+@app.on_event("startup")
+async def start_event_hub():
+    events.hub.bind(asyncio.get_running_loop())
+    app.state.expiry_watcher = asyncio.create_task(events.watch_expiry(load_expiring_items))
+
+@app.on_event("shutdown")
+async def stop_event_hub():
+    app.state.expiry_watcher.cancel()
+
+# Optional in-process insights scheduler; `python insights.py` does the same out of process
+@app.on_event("startup")
+async def start_insights_scheduler():
+    interval = os.getenv("INSIGHTS_INTERVAL")
+    app.state.insights_scheduler = None
+    if interval:
+        app.state.insights_scheduler = asyncio.create_task(insights.run_scheduler(int(interval)))
+
+@app.on_event("shutdown")
+async def stop_insights_scheduler():
+    if app.state.insights_scheduler:
+        app.state.insights_scheduler.cancel()
 
 @app.get("/")
 def read_root():
@@ -54,16 +137,106 @@ def create_fridge(fridge: schemas.FridgeCreate, db: Session = Depends(get_db)):
     # Hardcoded user_id for MVP
     return crud.create_user_fridge(db=db, fridge=fridge, user_id=1)
 
-@app.get("/fridges/", response_model=List[schemas.Fridge])
-def read_fridges(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    fridges = crud.get_fridges(db, user_id=1, skip=skip, limit=limit)
-    return fridges
+@app.get("/fridges/", response_model=List[schemas.FridgeFields])
+def read_fridges(request: Request, response: Response, skip: int = 0, limit: int = 100,
+                 fields: Optional[str] = None, db: Session = Depends(get_db)):
+    fridge_fields = parse_fields(fields, schemas.Fridge)
+    not_modified = check_etag(request, response, inventory_etag(db, user_id=1))
+    if not_modified:
+        return not_modified
+    fridges = crud.get_fridge_rows(db, user_id=1, fields=fridge_fields, item_fields=tuple(schemas.Item.model_fields),
+                                   skip=skip, limit=limit)
+    return lean_response(fridges, response)
+
+def timed_health_analysis(items: list):
+    """
+    Returns (analysis, elapsed seconds, error). analyze_fridge_health swallows its
+    own failures and returns a score-0 placeholder, so that counts as an error too.
+    """
+    start_time = time.perf_counter()
+    try:
+        analysis = ai_service.analyze_fridge_health(items)
+    except Exception as e:
+        return None, time.perf_counter() - start_time, str(e)
+    elapsed = time.perf_counter() - start_time
+    if not insights.is_usable("health", analysis):
+        return analysis, elapsed, (analysis or {}).get("analysis") or "Could not generate analysis."
+    return analysis, elapsed, None
+
+# Registered before /fridges/{fridge_id} so "analysis" isn't parsed as an id
+@app.get("/fridges/analysis")
+def analyze_all_fridges(db: Session = Depends(get_db)):
+    """
+    Health analysis for every fridge, streamed as NDJSON (one line per fridge,
+    in completion order) so the dashboard can render each score as it lands.
+    Fresh precomputed insights and empty fridges are sent first; the rest run concurrently.
+    """
+    fridges, items_by_fridge = crud.get_user_items_by_fridge(db, user_id=1)
+
+    cached, empty, pending = [], [], []
+    for fridge in fridges:
+        items = items_by_fridge[fridge.id]
+        insight = crud.get_insight(db, user_id=1, kind="health", fridge_id=fridge.id)
+        if insights.is_fresh(insight, fridge.version):
+            cached.append((fridge.id, fridge.name, insight.payload))
+        elif not items:
+            # Same as insights.plan_jobs: no point spending a Gemini call on an empty inventory
+            empty.append((fridge.id, fridge.name))
+        else:
+            pending.append((fridge.id, fridge.name, fridge.version, items))
+
+    def line(fridge_id, name, status, elapsed=0, cached_result=False, analysis=None, error=None):
+        result = {
+            "fridge_id": fridge_id,
+            "name": name,
+            "status": status,
+            "cached": cached_result,
+            "elapsed_ms": round(elapsed * 1000),
+            "analysis": analysis
+        }
+        if error:
+            result["detail"] = error
+        return orjson.dumps(result) + b"\n"
+
+    def stream():
+        for fridge_id, name, payload in cached:
+            yield line(fridge_id, name, "ok", cached_result=True, analysis=payload)
+        for fridge_id, name in empty:
+            yield line(fridge_id, name, "empty")
+        if not pending:
+            return
+
+        # The request's session may already be closed while we stream, so results are saved on our own
+        save_db = SessionLocal()
+        executor = ThreadPoolExecutor(max_workers=ANALYSIS_CONCURRENCY)
+        try:
+            futures = {executor.submit(timed_health_analysis, items): (fridge_id, name, version)
+                       for fridge_id, name, version, items in pending}
+            for future in as_completed(futures):
+                fridge_id, name, version = futures[future]
+                analysis, elapsed, error = future.result()
+                if error:
+                    yield line(fridge_id, name, "error", elapsed, analysis=analysis, error=error)
+                    continue
+                crud.save_insight(save_db, user_id=1, kind="health", inventory_version=version,
+                                  payload=analysis, fridge_id=fridge_id)
+                yield line(fridge_id, name, "ok", elapsed, analysis=analysis)
+        finally:
+            # Not a `with` block: on client disconnect that would wait for every queued
+            # AI call. Drop the queued ones and let in-flight calls finish in the background.
+            executor.shutdown(wait=False, cancel_futures=True)
+            save_db.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 @app.get("/fridges/{fridge_id}", response_model=schemas.Fridge)
-def read_fridge(fridge_id: int, db: Session = Depends(get_db)):
+def read_fridge(fridge_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     db_fridge = crud.get_fridge(db, fridge_id=fridge_id, user_id=1)
     if db_fridge is None:
         raise HTTPException(status_code=404, detail="Fridge not found")
+    not_modified = check_etag(request, response, fridge_etag(db_fridge))
+    if not_modified:
+        return not_modified
     return db_fridge
 
 @app.delete("/fridges/{fridge_id}", response_model=schemas.Fridge)
@@ -83,14 +256,19 @@ def create_item_for_fridge(
         raise HTTPException(status_code=404, detail="Fridge not found")
     return crud.create_fridge_item(db=db, item=item, fridge_id=fridge_id)
 
-@app.get("/fridges/{fridge_id}/items/", response_model=List[schemas.Item])
-def read_items(fridge_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@app.get("/fridges/{fridge_id}/items/", response_model=List[schemas.ItemFields])
+def read_items(fridge_id: int, request: Request, response: Response, skip: int = 0, limit: int = 100,
+               fields: Optional[str] = None, db: Session = Depends(get_db)):
+    item_fields = parse_fields(fields, schemas.Item)
     # Check if fridge exists
     db_fridge = crud.get_fridge(db, fridge_id=fridge_id, user_id=1)
     if db_fridge is None:
         raise HTTPException(status_code=404, detail="Fridge not found")
-    items = crud.get_items(db, fridge_id=fridge_id, skip=skip, limit=limit)
-    return items
+    not_modified = check_etag(request, response, fridge_etag(db_fridge))
+    if not_modified:
+        return not_modified
+    items = crud.get_item_rows(db, fridge_id=fridge_id, fields=item_fields, skip=skip, limit=limit)
+    return lean_response(items, response)
 
 @app.delete("/items/{item_id}", response_model=schemas.Item)
 def delete_item(item_id: int, db: Session = Depends(get_db)):
@@ -124,42 +302,133 @@ def analyze_fridge(fridge_id: int, db: Session = Depends(get_db)):
         db_fridge = crud.get_fridge(db, fridge_id=fridge_id, user_id=1)
         if not db_fridge:
              raise HTTPException(status_code=404, detail="Fridge not found")
+
+        # Serve the precomputed insight unless the fridge changed since it was generated
+        insight = crud.get_insight(db, user_id=1, kind="health", fridge_id=fridge_id)
+        if insights.is_fresh(insight, db_fridge.version):
+            return insight.payload
              
         items = crud.get_items(db, fridge_id=fridge_id, limit=1000)
         print(f"DEBUG: Found {len(items)} items for analysis.")
         
         analysis = ai_service.analyze_fridge_health(items)
         print("DEBUG: Analysis successful:", analysis)
+        if insights.is_usable("health", analysis):
+            crud.save_insight(db, user_id=1, kind="health", inventory_version=db_fridge.version,
+                              payload=analysis, fridge_id=fridge_id)
         return analysis
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
-@app.get("/items/expiring", response_model=List[schemas.Item])
-def read_expiring_items(db: Session = Depends(get_db)):
-    return crud.get_expiring_items(db, user_id=1)
+@app.get("/items/expiring", response_model=List[schemas.ItemFields])
+def read_expiring_items(request: Request, response: Response, fields: Optional[str] = None, db: Session = Depends(get_db)):
+    item_fields = parse_fields(fields, schemas.Item)
+    # The expiry window moves with the calendar, so today's date is part of the tag
+    etag = f'W/"inv-{crud.get_inventory_version(db, user_id=1)}-{date.today().isoformat()}"'
+    not_modified = check_etag(request, response, etag)
+    if not_modified:
+        return not_modified
+    items = crud.get_expiring_item_rows(db, user_id=1, fields=item_fields)
+    return lean_response(items, response)
 
-@app.post("/recipes/generate")
-def generate_recipes(db: Session = Depends(get_db)):
-    # 1. Fetch all items across all fridges for user 1
+@app.websocket("/ws")
+async def inventory_events(websocket: WebSocket):
+    """
+    Pushes item/fridge create, update and delete events, nutrition enrichment
+    completions and expiry transitions. A "resync" event means the client fell
+    behind and should catch up via /changes.
+    """
+    await websocket.accept()
+    # Assuming user_id=1 for MVP
+    subscriber = events.hub.subscribe(1)
+
+    async def drain_client():
+        # We don't expect client messages; this just notices the disconnect
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    reader = asyncio.create_task(drain_client())
+    try:
+        version = await asyncio.to_thread(load_inventory_version, 1)
+        await websocket.send_json({"type": "hello", "version": version})
+        while True:
+            getter = asyncio.create_task(subscriber.queue.get())
+            done, _ = await asyncio.wait({getter, reader}, return_when=asyncio.FIRST_COMPLETED)
+            if reader in done:
+                getter.cancel()
+                break
+            payload = getter.result()
+            if payload.get("type") == "resync":
+                payload["version"] = await asyncio.to_thread(load_inventory_version, 1)
+            await websocket.send_json(payload)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+        events.hub.unsubscribe(subscriber)
+
+@app.get("/changes", response_model=schemas.ChangeFeed)
+def read_changes(since: int = 0, db: Session = Depends(get_db)):
+    # Clients pass the last version they saw and apply only the deltas
+    return crud.get_changes(db, user_id=1, since=since)
+
+def generate_and_store_recipes(db: Session, version: int):
     items = crud.get_all_user_items(db, user_id=1)
-    
     if not items:
         return []
-        
-    # 2. Call AI
     recipes = ai_service.generate_recipes(items)
+    if insights.is_usable("recipes", recipes):
+        crud.save_insight(db, user_id=1, kind="recipes", inventory_version=version, payload=recipes)
     return recipes
 
+@app.get("/recipes/suggestions")
+def read_recipe_suggestions(db: Session = Depends(get_db)):
+    # Precomputed suggestions, served instantly unless the inventory changed since they were generated
+    version = crud.get_inventory_version(db, user_id=1)
+    insight = crud.get_insight(db, user_id=1, kind="recipes")
+    if insights.is_fresh(insight, version):
+        return insight.payload
+    return generate_and_store_recipes(db, version)
+
+@app.post("/recipes/generate")
+def generate_recipes(db: Session = Depends(get_db)):
+    # Always asks the AI for new ideas; the result also becomes the stored suggestions
+    version = crud.get_inventory_version(db, user_id=1)
+    return generate_and_store_recipes(db, version)
+
 @app.post("/recipes/save", response_model=schemas.Recipe)
 def save_recipe(recipe: schemas.RecipeCreate, db: Session = Depends(get_db)):
     # Assuming user_id=1 for MVP
     return crud.create_recipe(db=db, recipe=recipe, user_id=1)
 
-@app.get("/recipes/", response_model=List[schemas.Recipe])
-def read_recipes(db: Session = Depends(get_db)):
-    return crud.get_recipes(db, user_id=1)
+@app.get("/recipes/", response_model=List[schemas.RecipeFields])
+def read_recipes(skip: int = 0, limit: int = 100, fields: Optional[str] = None, db: Session = Depends(get_db)):
+    recipe_fields = parse_fields(fields, schemas.Recipe)
+    return ORJSONResponse(crud.get_recipe_rows(db, user_id=1, fields=recipe_fields, skip=skip, limit=limit))
+
+@app.get("/recipes/search", response_model=List[schemas.RecipeFields])
+def search_recipes(
+    q: Optional[str] = None,
+    ingredient: List[str] = Query(default=[]),
+    difficulty: Optional[str] = None,
+    max_time: Optional[int] = None,
+    skip: int = 0,
+    limit: int = Query(default=20, le=100),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    # ?q=garlic&ingredient=chicken&ingredient=rice&difficulty=Easy&max_time=30 (minutes)
+    recipe_fields = parse_fields(fields, schemas.Recipe)
+    recipes = crud.search_recipe_rows(
+        db, user_id=1, fields=recipe_fields, q=q, ingredients=ingredient,
+        difficulty=difficulty, max_minutes=max_time, skip=skip, limit=limit
+    )
+    return ORJSONResponse(recipes)
 
 @app.delete("/recipes/{recipe_id}")
 def delete_recipe(recipe_id: int, db: Session = Depends(get_db)):
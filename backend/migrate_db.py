@@ -3,7 +3,11 @@ import os
 
 db_path = "sql_app.db"
 
-if os.path.exists(db_path):
+def migrate():
+    if not os.path.exists(db_path):
+        print("DB file not found (run init_db.py to create it).")
+        return
+
     try:
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
@@ -19,9 +23,61 @@ if os.path.exists(db_path):
             print("Column added.")
         else:
             print("Column already exists.")
+
+        # Inventory versioning (ETags / change feed)
+        cursor.execute("PRAGMA table_info(users)")
+        columns = [info[1] for info in cursor.fetchall()]
+        if "inventory_version" not in columns:
+            print("Adding users.inventory_version column...")
+            cursor.execute("ALTER TABLE users ADD COLUMN inventory_version INTEGER NOT NULL DEFAULT 0")
+            conn.commit()
+
+        cursor.execute("PRAGMA table_info(fridges)")
+        columns = [info[1] for info in cursor.fetchall()]
+        if "version" not in columns:
+            print("Adding fridges.version column...")
+            cursor.execute("ALTER TABLE fridges ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            conn.commit()
+
+        # Canonical food ids (name normalization)
+        cursor.execute("PRAGMA table_info(items)")
+        columns = [info[1] for info in cursor.fetchall()]
+        if "canonical_id" not in columns:
+            print("Adding items.canonical_id column...")
+            cursor.execute("ALTER TABLE items ADD COLUMN canonical_id INTEGER REFERENCES canonical_foods(id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_items_canonical_id ON items (canonical_id)")
+            conn.commit()
+
+        # Recipe search (ingredient join table and FTS index are created by init_db.py)
+        cursor.execute("PRAGMA table_info(recipes)")
+        columns = [info[1] for info in cursor.fetchall()]
+        if "time_minutes" not in columns:
+            print("Adding recipes.time_minutes column...")
+            cursor.execute("ALTER TABLE recipes ADD COLUMN time_minutes INTEGER")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_recipes_time_minutes ON recipes (time_minutes)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_recipes_difficulty ON recipes (difficulty)")
+            conn.commit()
+
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'recipe_ingredients'")
+        if cursor.fetchone():
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_recipe_ingredients_name ON recipe_ingredients (name)")
+            conn.commit()
+
+        # One insight per (user, kind, fridge); keep the newest row of any duplicates
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'insights'")
+        if cursor.fetchone():
+            cursor.execute(
+                "DELETE FROM insights WHERE id NOT IN "
+                "(SELECT MAX(id) FROM insights GROUP BY user_id, kind, COALESCE(fridge_id, 0))"
+            )
+            cursor.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ux_insights_scope ON insights (user_id, kind, COALESCE(fridge_id, 0))"
+            )
+            conn.commit()
             
         conn.close()
     except Exception as e:
         print(f"Error migrating DB: {e}")
-else:
-    print("DB file not found (might be created on first request).")
+
+if __name__ == "__main__":
+    migrate()
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Date, JSON
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, Date, DateTime, JSON, func
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -9,6 +9,8 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
+    # Bumped on every inventory write; used for ETags and the change feed
+    inventory_version = Column(Integer, default=0, nullable=False)
 
     fridges = relationship("Fridge", back_populates="owner")
     recipes = relationship("Recipe", back_populates="owner")
@@ -22,10 +24,23 @@ class Recipe(Base):
     matching_ingredients = Column(JSON)
     missing_ingredients = Column(JSON)
     time = Column(String)
-    difficulty = Column(String)
+    time_minutes = Column(Integer, nullable=True, index=True) # parsed from `time` for filtering
+    difficulty = Column(String, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
 
     owner = relationship("User", back_populates="recipes")
+    ingredients = relationship("RecipeIngredient", back_populates="recipe", cascade="all, delete-orphan")
+
+class RecipeIngredient(Base):
+    __tablename__ = "recipe_ingredients"
+
+    id = Column(Integer, primary_key=True, index=True)
+    recipe_id = Column(Integer, ForeignKey("recipes.id"), index=True)
+    canonical_id = Column(Integer, ForeignKey("canonical_foods.id"), nullable=True, index=True)
+    name = Column(String, index=True) # food name parsed from the recipe line, in canonical_key form
+    missing = Column(Boolean, default=False) # True if the user had to buy it
+
+    recipe = relationship("Recipe", back_populates="ingredients")
 
 class Fridge(Base):
     __tablename__ = "fridges"
@@ -33,6 +48,7 @@ class Fridge(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
+    version = Column(Integer, default=0, nullable=False)
 
     owner = relationship("User", back_populates="fridges")
     items = relationship("Item", back_populates="fridge")
@@ -48,5 +64,48 @@ class Item(Base):
     nutritional_info = Column(JSON, nullable=True)
     notes = Column(String, nullable=True)
     fridge_id = Column(Integer, ForeignKey("fridges.id"))
+    canonical_id = Column(Integer, ForeignKey("canonical_foods.id"), nullable=True, index=True)
 
     fridge = relationship("Fridge", back_populates="items")
+
+class InventoryChange(Base):
+    __tablename__ = "inventory_changes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    version = Column(Integer, index=True)
+    entity = Column(String) # "fridge" or "item"
+    entity_id = Column(Integer)
+    fridge_id = Column(Integer, nullable=True)
+    op = Column(String) # "created", "updated" or "deleted"
+
+class Insight(Base):
+    __tablename__ = "insights"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    fridge_id = Column(Integer, nullable=True) # set for per-fridge insights
+    kind = Column(String) # "health" or "recipes"
+    inventory_version = Column(Integer) # fridge/user version the insight was generated from
+    payload = Column(JSON)
+    generated_at = Column(DateTime)
+
+    # One insight per scope; COALESCE because NULL fridge_ids never collide in a plain unique index
+    __table_args__ = (
+        Index("ux_insights_scope", "user_id", "kind", func.coalesce(fridge_id, 0), unique=True),
+    )
+
+class CanonicalFood(Base):
+    __tablename__ = "canonical_foods"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, unique=True, index=True) # normalized, order-insensitive name
+    name = Column(String) # first name seen, for display
+
+class NutritionCache(Base):
+    __tablename__ = "nutrition_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    canonical_id = Column(Integer, ForeignKey("canonical_foods.id"), index=True)
+    unit = Column(String) # normalized unit, "" when none
+    per_unit = Column(JSON) # nutrition for a quantity of 1
@@ -25,6 +25,7 @@ class ItemUpdate(BaseModel):
 class Item(ItemBase):
     id: int
     fridge_id: int
+    canonical_id: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -44,6 +45,27 @@ class Fridge(FridgeBase):
     class Config:
         from_attributes = True
 
+class FridgeSummary(FridgeBase):
+    id: int
+    user_id: int
+
+    class Config:
+        from_attributes = True
+
+# Change Feed Schemas
+class InventoryChange(BaseModel):
+    version: int
+    entity: str
+    entity_id: int
+    fridge_id: Optional[int] = None
+    op: str
+    item: Optional[Item] = None
+    fridge: Optional[FridgeSummary] = None
+
+class ChangeFeed(BaseModel):
+    version: int
+    changes: List[InventoryChange] = []
+
 # User Schemas
 class UserBase(BaseModel):
     email: str
@@ -74,10 +96,40 @@ class RecipeCreate(RecipeBase):
 class Recipe(RecipeBase):
     id: int
     user_id: int
+    time_minutes: Optional[int] = None
 
     class Config:
         from_attributes = True
 
+# Sparse fieldset schemas (?fields=...): only "id" is guaranteed, any other field may be omitted
+class ItemFields(BaseModel):
+    id: int
+    name: Optional[str] = None
+    quantity: Optional[int] = None
+    unit: Optional[str] = None
+    expiration_date: Optional[date] = None
+    nutritional_info: Optional[Any] = None
+    notes: Optional[str] = None
+    fridge_id: Optional[int] = None
+    canonical_id: Optional[int] = None
+
+class FridgeFields(BaseModel):
+    id: int
+    name: Optional[str] = None
+    user_id: Optional[int] = None
+    items: Optional[List[Item]] = None
+
+class RecipeFields(BaseModel):
+    id: int
+    title: Optional[str] = None
+    instructions: Optional[List[str]] = None
+    matching_ingredients: Optional[List[str]] = None
+    missing_ingredients: Optional[List[str]] = None
+    time: Optional[str] = None
+    difficulty: Optional[str] = None
+    user_id: Optional[int] = None
+    time_minutes: Optional[int] = None
+
 # Goal Schemas
 class GoalRequest(BaseModel):
     goal: str
@@ -0,0 +1,48 @@
+from canonical import canonical_key, ingredient_names, SimilarityIndex, SIMILARITY_THRESHOLD
+
+def build_index(keys):
+    index = SimilarityIndex()
+    for food_id, key in enumerate(keys):
+        index.add(food_id, key)
+    return index
+
+def test_canonical_key_merges_variants():
+    assert canonical_key("Greek yogurt") == "greek yogurt"
+    assert canonical_key("greek yoghurt 2%") == "greek yogurt"
+    assert canonical_key("Yogurt, Greek") == "greek yogurt"
+    assert canonical_key("Eggs") == canonical_key("egg")
+    assert canonical_key("Tomatoes") == "tomato"
+    assert canonical_key("Hummus") == "hummus"
+
+def test_canonical_key_keeps_different_foods_apart():
+    assert canonical_key("chocolate milk") != canonical_key("milk chocolate")
+    assert canonical_key("minced garlic") != canonical_key("ground garlic")
+    assert canonical_key("Whole Milk") != canonical_key("Milk")
+
+def test_best_match_finds_variants():
+    index = build_index(["greek yogurt", "chocolate milk", "garlic", "broccoli"])
+    for name in ["Greek yogurt", "greek yoghurt 2%", "Yogurt, Greek"]:
+        food_id, score = index.best_match(canonical_key(name))
+        assert food_id == 0
+        assert score >= SIMILARITY_THRESHOLD
+
+def test_best_match_rejects_different_foods():
+    index = build_index(["chocolate milk", "ground garlic", "greek yogurt"])
+    for name in ["milk chocolate", "minced garlic"]:
+        _, score = index.best_match(canonical_key(name))
+        assert score < SIMILARITY_THRESHOLD, name
+
+def test_best_match_empty_index():
+    assert SimilarityIndex().best_match("milk") == (None, 0.0)
+
+def test_ingredient_names_strip_measures_and_split():
+    assert ingredient_names("2 cups cooked rice") == ["rice"]
+    assert ingredient_names("salt and pepper") == ["salt", "pepper"]
+    assert ingredient_names("2 cloves garlic, minced") == ["garlic"]
+    assert ingredient_names("1 can (400g) chopped tomatoes") == ["tomato"]
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
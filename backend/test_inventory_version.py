@@ -0,0 +1,55 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import crud, models, schemas
+from database import Base
+
+WRITERS = 8
+
+def make_session_factory(path):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def test_concurrent_updates_get_distinct_versions():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session = make_session_factory(os.path.join(tmp, "inventory.db"))
+        db = Session()
+        db_user = models.User(email="race@example.com", hashed_password="x", is_active=True)
+        db.add(db_user)
+        db.flush()
+        db_fridge = models.Fridge(name="Kitchen", user_id=db_user.id)
+        db.add(db_fridge)
+        db.flush()
+        # canonical_id is set so update_item doesn't need the canonical index
+        db_item = models.Item(name="milk", quantity=1, fridge_id=db_fridge.id, canonical_id=1)
+        db.add(db_item)
+        db.commit()
+        user_id, item_id = db_user.id, db_item.id
+        db.close()
+
+        def write(quantity):
+            session = Session()
+            try:
+                update = schemas.ItemUpdate(quantity=quantity, nutritional_info={"calories": quantity})
+                crud.update_item(session, item_id, update)
+            finally:
+                session.close()
+
+        with ThreadPoolExecutor(max_workers=WRITERS) as executor:
+            list(executor.map(write, range(1, WRITERS + 1)))
+
+        db = Session()
+        versions = [v for (v,) in db.query(models.InventoryChange.version).filter(
+            models.InventoryChange.user_id == user_id).all()]
+        assert sorted(versions) == list(range(1, WRITERS + 1))
+        assert crud.get_inventory_version(db, user_id) == WRITERS
+        db.close()
+        engine.dispose()
+
+if __name__ == "__main__":
+    test_concurrent_updates_get_distinct_versions()
+    print("inventory version: ok")
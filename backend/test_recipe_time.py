@@ -0,0 +1,22 @@
+from crud import parse_minutes
+
+def test_parse_minutes_formats():
+    assert parse_minutes("30 mins") == 30
+    assert parse_minutes("45 minutes") == 45
+    assert parse_minutes("1 hr 15 mins") == 75
+    assert parse_minutes("1.5 hours") == 90
+    assert parse_minutes("1 hour") == 60
+    assert parse_minutes("1h30") == 90
+    assert parse_minutes("1h 30m") == 90
+    assert parse_minutes("2h") == 120
+    assert parse_minutes("20") == 20
+
+def test_parse_minutes_without_numbers():
+    assert parse_minutes("quick") is None
+    assert parse_minutes("") is None
+    assert parse_minutes(None) is None
+
+if __name__ == "__main__":
+    test_parse_minutes_formats()
+    test_parse_minutes_without_numbers()
+    print("parse_minutes: ok")
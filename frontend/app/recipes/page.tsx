@@ -15,11 +15,17 @@ export default function RecipesPage() {
 
     const fetchSavedRecipes = async () => {
         try {
-            const res = await fetch('http://localhost:8000/recipes/');
-            if (res.ok) {
-                const data = await res.json();
-                setSavedRecipes(data);
+            // The API returns at most `limit` recipes per call, so page through the whole cookbook
+            const limit = 100;
+            const all: any[] = [];
+            while (true) {
+                const res = await fetch(`http://localhost:8000/recipes/?skip=${all.length}&limit=${limit}`);
+                if (!res.ok) return;
+                const page = await res.json();
+                all.push(...page);
+                if (page.length < limit) break;
             }
+            setSavedRecipes(all);
         } catch (error) {
             console.error("Failed to fetch saved recipes:", error);
         }